@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Helpers shared by runner.py and toxicity_score.py.
+Pomocné funkce sdílené skripty runner.py a toxicity_score.py.
+
+- RateLimiter: sliding-window RPM/TPM limiter (blocking and asyncio)
+- json_dumps / json_loads: orjson when installed, stdlib json otherwise
+"""
+
+import asyncio, threading, time
+from collections import deque
+
+# orjson when available (bytes in/out, C speed), stdlib json otherwise;orjson pokud je k dispozici, jinak stdlib json
+try:
+    import orjson
+    json_dumps, json_loads = orjson.dumps, orjson.loads
+except ImportError:
+    import json
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    json_loads = json.loads
+
+
+class RateLimiter:
+    """Sliding-window RPM/TPM limiter; acquire() waits until the call fits the quota."""
+
+    def __init__(self, rpm: int, tpm: int, window_s: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window_s = window_s
+        self._events = deque()  # (ts, tokens)
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens_est: int) -> float:
+        """Books the call and returns 0, or returns seconds until the window has room."""
+        tokens_est = min(tokens_est, self.tpm)
+        with self._lock:
+            now = time.monotonic()
+            while self._events and now - self._events[0][0] >= self.window_s:
+                self._tokens -= self._events.popleft()[1]
+            if len(self._events) < self.rpm and self._tokens + tokens_est <= self.tpm:
+                self._events.append((now, tokens_est))
+                self._tokens += tokens_est
+                return 0.0
+            return max(self._events[0][0] + self.window_s - now, 0.05)
+
+    def acquire(self, tokens_est: int) -> None:
+        while (wait := self._reserve(tokens_est)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens_est: int) -> None:
+        while (wait := self._reserve(tokens_est)) > 0:
+            await asyncio.sleep(wait)
@@ -1,14 +1,14 @@
 #!/usr/bin/env python3
 """
 toxicity_score.py
-- Reads input CSV with columns:
+- Reads input CSV (or runner's results.jsonl) with columns:
   ts_iso,model_vendor,model_name,model_version,geo_country,geo_code,vpn_node_id,
   vpn_ip,vpn_country,vpn_via,prompt_id,prompt_lang,response_text,refusal_flag,
   refusal_reason,tokens_in,tokens_out,length_chars,length_words,toxicity_score,
   safety_flags,notes
 - Calculates toxicity_score via Perspective API and writes output CSV
   with header/column order preserved.
-- Čte vstupní CSV se sloupci:
+- Čte vstupní CSV (nebo results.jsonl z runneru) se sloupci:
   ts_iso,model_vendor,model_name,model_version,geo_country,geo_code,vpn_node_id,
   vpn_ip,vpn_country,vpn_via,prompt_id,prompt_lang,response_text,refusal_flag,
   refusal_reason,tokens_in,tokens_out,length_chars,length_words,toxicity_score,
@@ -18,10 +18,18 @@ toxicity_score.py
 
 Použití:
   export PERSPECTIVE_API_KEY="..."; python3 toxicity_score.py input.csv output.csv
+  export PERSPECTIVE_API_KEY="..."; python3 toxicity_score.py results.jsonl output.csv
+  PERSPECTIVE_QPS_DELAY=float (default: 1.0) – min. seconds between requests
+  PERSPECTIVE_WORKERS=int (default: 10) – concurrent requests
 """
 
-import csv, json, os, sys, time
+import csv, operator, os, sys
+import concurrent.futures
+from collections import deque
 import requests
+from requests.adapters import HTTPAdapter
+
+from common import RateLimiter, json_dumps, json_loads
 
 HEADER = [
     "ts_iso","model_vendor","model_name","model_version","geo_country","geo_code",
@@ -30,6 +38,9 @@ HEADER = [
     "length_chars","length_words","toxicity_score","safety_flags","notes"
 ]
 
+# position of each column in the output row;pozice sloupců ve výstupním řádku
+COL = {c: i for i, c in enumerate(HEADER)}
+
 API_URL = "https://commentanalyzer.googleapis.com/v1alpha1/comments:analyze"
 API_KEY = os.environ.get("PERSPECTIVE_API_KEY")
 # No key, no run – explicit message;Bez klíče nechceme běžet – explicitní hláška:
@@ -39,6 +50,14 @@ if __name__ == "__main__" and (not API_KEY):
 
 # QPS limit – recommend;doporučuju 1 req/s
 SLEEP_BETWEEN_REQ = float(os.environ.get("PERSPECTIVE_QPS_DELAY", "1.0"))
+# requests in flight; the QPS quota is still enforced by _LIMITER;souběžné požadavky, QPS hlídá _LIMITER
+WORKERS = int(os.environ.get("PERSPECTIVE_WORKERS", "10"))
+
+# one request per SLEEP_BETWEEN_REQ window, no token budget;jeden požadavek za okno SLEEP_BETWEEN_REQ, bez limitu tokenů
+_LIMITER = RateLimiter(rpm=1, tpm=sys.maxsize, window_s=SLEEP_BETWEEN_REQ)
+
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=WORKERS, max_retries=0))
 
 def score_toxicity(text: str, lang_hint: str) -> float | None:
     """Returns the number 0..1 (toxicity), or None on error. Vrátí číslo 0..1 (toxicity), nebo None při chybě."""
@@ -53,56 +72,86 @@ def score_toxicity(text: str, lang_hint: str) -> float | None:
         "doNotStore": True,
     }
     try:
-        r = requests.post(
+        _LIMITER.acquire(0)
+        r = _SESSION.post(
             f"{API_URL}?key={API_KEY}",
             headers={"Content-Type": "application/json"},
-            data=json.dumps(payload),
+            data=json_dumps(payload),
             timeout=30,
         )
         r.raise_for_status()
-        data = r.json()
+        data = json_loads(r.content)
         return data["attributeScores"]["TOXICITY"]["summaryScore"]["value"]
     except Exception as e:
         # we don't want to abort the run – we'll just return None;nechceme shodit běh – jen vrátíme None
         sys.stderr.write(f"[WARN] scoring failed: {e}\n")
         return None
 
+def _score_row(i: int, row: list) -> None:
+    # Select language according to prompt_lang;podle prompt_lang zvol jazyk
+    lang_hint = row[COL["prompt_lang"]] or "EN"
+    txt = row[COL["response_text"]]
+    tox = score_toxicity(txt, lang_hint)
+    row[COL["toxicity_score"]] = f"{tox:.6f}" if isinstance(tox, (int, float)) else ""
+    # friendly progress to stderr;přátelský progress do stderr
+    sys.stderr.write(f"[{i}] {row[COL['geo_code']]} {row[COL['model_vendor']]}:{row[COL['model_name']]} "
+                     f"{row[COL['prompt_id']]} -> tox={row[COL['toxicity_score']]}\n")
+
+def _csv_rows(f_in):
+    reader = csv.reader(f_in)
+    header = next(reader, [])
+    # verify that the input has at least the expected columns (it can also have additional ones);ověř, že vstup má alespoň očekávané sloupce (klidně může mít i další)
+    missing = [c for c in HEADER if c not in header]
+    if missing:
+        sys.stderr.write(f"[INFO] Columns are missing in the input: {', '.join(missing)} – I will fill in the blanks.\n")
+    # input index per HEADER column; missing ones point at the "" padded onto each row;vstupní index pro každý sloupec HEADER, chybějící ukazují na doplněné ""
+    width = len(header)
+    get_cols = operator.itemgetter(*[header.index(c) if c in header else width for c in HEADER])
+    for raw in reader:
+        if not raw:
+            continue  # blank line, skipped like DictReader did;prázdný řádek, přeskočen jako u DictReader
+        # drop overflow fields, then pad short rows plus the "" slot for missing columns;zahoď přebytečná pole, doplň krátké řádky i slot "" pro chybějící sloupce
+        del raw[width:]
+        raw.extend([""] * (width + 1 - len(raw)))
+        yield list(get_cols(raw))
+
+def _jsonl_rows(f_in):
+    # one JSON object per line, no CSV parsing; None/missing -> "";jeden JSON objekt na řádek, bez parsování CSV
+    for line in f_in:
+        if line.strip():
+            rec = json_loads(line)
+            yield ["" if (v := rec.get(c)) is None else v for c in HEADER]
+
 def main(inp: str, outp: str):
     # Read input – but always write output in exact HEAD order.;Načti vstup – ale výstup vždy zapisujeme v přesné HEAD pořadí.
     with open(inp, "r", encoding="utf-8", newline="") as f_in, \
-         open(outp, "w", encoding="utf-8", newline="") as f_out:
+         open(outp, "w", encoding="utf-8", newline="") as f_out, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS) as pool:
+
+        rows = _jsonl_rows(f_in) if inp.endswith(".jsonl") else _csv_rows(f_in)
 
-        reader = csv.DictReader(f_in)
-        # verify that the input has at least the expected columns (it can also have additional ones);ověř, že vstup má alespoň očekávané sloupce (klidně může mít i další)
-        missing = [c for c in HEADER if c not in (reader.fieldnames or [])]
-        if missing:
-            sys.stderr.write(f"[INFO] Columns are missing in the input: {', '.join(missing)} – I will fill in the blanks.\n")
+        writer = csv.writer(f_out)
+        writer.writerow(HEADER)
 
-        writer = csv.DictWriter(f_out, fieldnames=HEADER)
-        writer.writeheader()
+        # bounded window of in-flight rows, written back in input order;omezené okno rozpracovaných řádků, zápis v pořadí vstupu
+        pending = deque()
 
-        for i, row in enumerate(reader, 1):
-            # Add the missing keys so that we can always write in HEADER order.;doplň chybějící klíče, ať vždy můžeme psát v HEADER pořadí
-            for col in HEADER:
-                row.setdefault(col, "")
+        def flush(limit: int) -> None:
+            while len(pending) > limit:
+                row, fut = pending.popleft()
+                if fut is not None:
+                    fut.result()
+                writer.writerow(row)
 
+        for i, row in enumerate(rows, 1):
             # if toxicity_score already exists and is not empty, keep it;pokud už toxicity_score existuje a není prázdný, ponech ho
-            tox_val = row.get("toxicity_score", "")
-            if tox_val == "":
-                # Select language according to prompt_lang;podle prompt_lang zvol jazyk
-                lang_hint = row.get("prompt_lang", "EN")
-                txt = row.get("response_text", "")
-                tox = score_toxicity(txt, lang_hint)
-                row["toxicity_score"] = f"{tox:.6f}" if isinstance(tox, (int, float)) else ""
-                # friendly progress to stderr;přátelský progress do stderr
-                sys.stderr.write(f"[{i}] {row.get('geo_code','?')} {row.get('model_vendor','?')}:{row.get('model_name','?')} "
-                                 f"{row.get('prompt_id','?')} -> tox={row['toxicity_score']}\n")
-                time.sleep(SLEEP_BETWEEN_REQ)
-
-            writer.writerow({k: row.get(k, "") for k in HEADER})
+            fut = pool.submit(_score_row, i, row) if row[COL["toxicity_score"]] == "" else None
+            pending.append((row, fut))
+            flush(WORKERS * 4)
+        flush(0)
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
-        print("Použití: python3 toxicity_score.py input.csv output.csv", file=sys.stderr)
+        print("Použití: python3 toxicity_score.py input.csv|input.jsonl output.csv", file=sys.stderr)
         sys.exit(1)
     main(sys.argv[1], sys.argv[2])
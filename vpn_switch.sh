@@ -6,6 +6,7 @@
 # Podporuje ProtonVPN CLI (oficiální „protonvpn-cli“ nebo pip „protonvpn“),
 # konfigurace Surfshark OpenVPN a profily WireGuard.
 # Usage: ./vpn_switch.sh <node-id>
+#        ./vpn_switch.sh --daemon   (reads node-ids from stdin, one per line)
 # Nodes: vpn-eu-1 | vpn-us-1 | vpn-br-1 | vpn-cn-1 | vpn-ir-1 | vpn-ru-1
 # Exit: prints "[VPN] <node> -> <IP> (<Country>) via <method>"
 
@@ -34,8 +35,6 @@ sudo -v || { echo "ERROR: sudo auth failed" >&2; exit 1; }
 SUDO_KEEPALIVE_PID=$!
 trap 'kill $SUDO_KEEPALIVE_PID 2>/dev/null || true' EXIT
 
-NODE=${1:?node_id required}
-
 # --- Proton CLI autodetekce ---
 if command -v protonvpn-cli >/dev/null 2>&1; then
   PVN_BIN="protonvpn-cli"
@@ -185,78 +184,98 @@ connect_wg_iface() {
   sudo wg-quick up "$iface"
 }
 
-# --- node mapping;mapování uzlů ---
-method=""
-target=""
-expected=()   # array
-
-case "$NODE" in
-  vpn-eu-1) method="openvpn"; target="$CONF_DIR/de-fra.prod.surfshark.com_udp.ovpn"; expected=("Germany" "Czechia");; 
-  vpn-us-1) method="openvpn"; target="$CONF_DIR/us-nyc.prod.surfshark.com_udp.ovpn";  expected=("United States");;  
-  vpn-br-1) method="openvpn"; target="$CONF_DIR/br-sao.prod.surfshark.com_udp.ovpn"; expected=("Brazil");;    
-  vpn-cn-1) method="openvpn"; target="$CONF_DIR/hk-hkg.prod.surfshark.com_udp.ovpn"; expected=("Hong Kong" "China");; 
-  vpn-ir-1) method="openvpn"; target="$CONF_DIR/ae-dub.prod.surfshark.com_udp.ovpn"; expected=("United Arab Emirates" "Iran");; 
-  vpn-ru-1) method="proton";  target="RU"; expected=("Russia" "Russian Federation" "RU");;  # jediný Proton
-  *) die "unknown node '$NODE'";;
-esac
-
-# ---------- run;běh ----------
-prev_ip=$(curl "${CURL_OPTS[@]}" https://ifconfig.co/ip || true)
-disconnect_all
-sleep 1
-
-ok=0
-used=""
-
-if [[ "$method" == "proton" ]]; then
-    if [[ -n "$PVN_BIN" ]]; then
-      #optional RU mode without verification (only waits for RU_WAIT_S);volitelný RU režim bez ověřování (jen čeká RU_WAIT_S)
-      if connect_proton_cc "$target"; then
-        used="proton:$target"; ok=1
-        if [[ "$NODE" == "vpn-ru-1" && "$RU_SKIP_VERIFY" = "1" ]]; then
-          sleep "$RU_WAIT_S"
-        else
-          if ! wait_proton_connected "${expected[@]}"; then
-            say "[VPN] WARN: Proton not yet reporting expected country; continuing anyway"
+switch_node() {
+  NODE="$1"
+
+  # --- node mapping;mapování uzlů ---
+  method=""
+  target=""
+  expected=()   # array
+
+  case "$NODE" in
+    vpn-eu-1) method="openvpn"; target="$CONF_DIR/de-fra.prod.surfshark.com_udp.ovpn"; expected=("Germany" "Czechia");; 
+    vpn-us-1) method="openvpn"; target="$CONF_DIR/us-nyc.prod.surfshark.com_udp.ovpn";  expected=("United States");;  
+    vpn-br-1) method="openvpn"; target="$CONF_DIR/br-sao.prod.surfshark.com_udp.ovpn"; expected=("Brazil");;    
+    vpn-cn-1) method="openvpn"; target="$CONF_DIR/hk-hkg.prod.surfshark.com_udp.ovpn"; expected=("Hong Kong" "China");; 
+    vpn-ir-1) method="openvpn"; target="$CONF_DIR/ae-dub.prod.surfshark.com_udp.ovpn"; expected=("United Arab Emirates" "Iran");; 
+    vpn-ru-1) method="proton";  target="RU"; expected=("Russia" "Russian Federation" "RU");;  # jediný Proton
+    *) die "unknown node '$NODE'";;
+  esac
+
+  # ---------- run;běh ----------
+  prev_ip=$(curl "${CURL_OPTS[@]}" https://ifconfig.co/ip || true)
+  disconnect_all
+  sleep 1
+
+  ok=0
+  used=""
+
+  if [[ "$method" == "proton" ]]; then
+      if [[ -n "$PVN_BIN" ]]; then
+        #optional RU mode without verification (only waits for RU_WAIT_S);volitelný RU režim bez ověřování (jen čeká RU_WAIT_S)
+        if connect_proton_cc "$target"; then
+          used="proton:$target"; ok=1
+          if [[ "$NODE" == "vpn-ru-1" && "$RU_SKIP_VERIFY" = "1" ]]; then
+            sleep "$RU_WAIT_S"
+          else
+            if ! wait_proton_connected "${expected[@]}"; then
+              say "[VPN] WARN: Proton not yet reporting expected country; continuing anyway"
+            fi
           fi
         fi
       fi
-    fi
 
-elif [[ "$method" == "openvpn" ]]; then
-  #  Always OpenVPN for everyone else;Vždy OpenVPN pro všechny ostatní
-  if [[ -f "$target" ]]; then
-    connect_openvpn_conf "$target"; used="openvpn:${target##*/}"; ok=1
+  elif [[ "$method" == "openvpn" ]]; then
+    #  Always OpenVPN for everyone else;Vždy OpenVPN pro všechny ostatní
+    if [[ -f "$target" ]]; then
+      connect_openvpn_conf "$target"; used="openvpn:${target##*/}"; ok=1
+    fi
   fi
-fi
 
-# ---------- Final verification ----------
-if [[ "$NODE" == "vpn-ru-1" && "$RU_SKIP_VERIFY" = "1" ]]; then
-  out="$(ip_country || true)"
-  IFS="|" read -r new_ip new_ct <<< "${out:-|}"
-  [[ -z "${new_ip:-}" ]] && new_ip="?"
-  [[ -z "${new_ct:-}" ]] && new_ct="unknown"
-  [[ "${VPN_CHECK_DNS}" = "1" ]] && dns_leak_check || true
-  say "[VPN] $NODE -> $new_ip (${new_ct}) via ${used:-unknown}"
-else
-  # standard authentication for all other nodes;standardní ověřování pro všechny ostatní uzly
-  set +e
-  out=$(wait_for_change_and_verify "$prev_ip" "${expected[@]}")
-  set -e
-  IFS="|" read -r new_ip new_ct <<< "${out:-|}"
-  if [[ -z "${new_ip:-}" ]]; then
-    die "could not obtain public IP"
-  fi
-  if [[ "${VPN_CHECK_DNS}" = "1" ]]; then
-    dns_leak_check || true
+  # ---------- Final verification ----------
+  if [[ "$NODE" == "vpn-ru-1" && "$RU_SKIP_VERIFY" = "1" ]]; then
+    out="$(ip_country || true)"
+    IFS="|" read -r new_ip new_ct <<< "${out:-|}"
+    [[ -z "${new_ip:-}" ]] && new_ip="?"
+    [[ -z "${new_ct:-}" ]] && new_ct="unknown"
+    [[ "${VPN_CHECK_DNS}" = "1" ]] && dns_leak_check || true
+    say "[VPN] $NODE -> $new_ip (${new_ct}) via ${used:-unknown}"
+  else
+    # standard authentication for all other nodes;standardní ověřování pro všechny ostatní uzly
+    set +e
+    out=$(wait_for_change_and_verify "$prev_ip" "${expected[@]}")
+    set -e
+    IFS="|" read -r new_ip new_ct <<< "${out:-|}"
+    if [[ -z "${new_ip:-}" ]]; then
+      die "could not obtain public IP"
+    fi
+    if [[ "${VPN_CHECK_DNS}" = "1" ]]; then
+      dns_leak_check || true
+    fi
+    match=0
+    for a in "${expected[@]:-}"; do
+      [[ "$new_ct" == "$a" ]] && match=1 && break
+    done
+    if [[ $match -eq 0 ]]; then
+      say "[VPN] WARN: expected one of: ${expected[*]:-(any)}, got: '${new_ct:-}'"
+    fi
+    say "[VPN] $NODE -> $new_ip (${new_ct:-unknown}) via ${used:-unknown}"
   fi
-  match=0
-  for a in "${expected[@]:-}"; do
-    [[ "$new_ct" == "$a" ]] && match=1 && break
+}
+
+# --- entry: one-shot or --daemon;vstup: jednorázově nebo --daemon ---
+if [[ "${1:-}" == "--daemon" ]]; then
+  # one node id per stdin line; each switch runs in its own subshell so that "die"/set -e only end that switch.
+  # "[VPN-DONE] <rc>" terminates the stdout of every switch; stderr (errors, VPN_DEBUG trace) is left unmerged.
+  # jedno id uzlu na řádek stdin; každé přepnutí běží ve vlastním subshellu, "die"/set -e ukončí jen to přepnutí.
+  while IFS= read -r node; do
+    [[ -z "$node" ]] && continue
+    rc=0
+    ( switch_node "$node" ) &
+    wait $! || rc=$?
+    say "[VPN-DONE] $rc"
   done
-  if [[ $match -eq 0 ]]; then
-    say "[VPN] WARN: expected one of: ${expected[*]:-(any)}, got: '${new_ct:-}'"
-  fi
-  say "[VPN] $NODE -> $new_ip (${new_ct:-unknown}) via ${used:-unknown}"
+else
+  switch_node "${1:?node_id required}"
 fi
 